@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 from argparse import ArgumentParser
+import msgpack
 import requests
+from urllib.parse import quote
+
+
+MSGPACK = 'application/msgpack'
 
 parser = ArgumentParser(
     description="Command line client for The Items Service."
@@ -21,8 +26,12 @@ cmd_group.add_argument('-d', '--delete', metavar='name',
                        help="Delete an item.")
 cmd_group.add_argument('-l', '--list', action='store_true',
                        help="List all items.")
+cmd_group.add_argument('-n', '--count', action='store_true',
+                       help="Count all items.")
 parser.add_argument('-t', '--timeout', default=5, help="Timeout in seconds. "
                                                        "Default is 5.")
+parser.add_argument('-m', '--msgpack', action='store_true',
+                    help="Use MessagePack instead of JSON.")
 
 
 def get_error(response):
@@ -35,9 +44,31 @@ def get_error(response):
     )
 
 
-def create_item(service_url, timeout, name, description):
+def encode_body(body, use_msgpack):
+    """Keyword arguments for `requests` sending the given body."""
+    if not use_msgpack:
+        return {} if body is None else {'json': body}
+    kwargs = {'headers': {'Accept': MSGPACK}}
+    if body is not None:
+        kwargs['headers']['Content-Type'] = MSGPACK
+        kwargs['data'] = msgpack.packb(body, use_bin_type=True)
+    return kwargs
+
+
+def item_url(service_url, name):
+    return '{}/{}'.format(service_url.rstrip('/'), quote(name, safe=''))
+
+
+def decode_body(response):
+    if response.headers.get('Content-Type', '').startswith(MSGPACK):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def create_item(service_url, timeout, name, description, use_msgpack=False):
+    body = {'name': name, 'description': description}
     resp = requests.post(service_url, timeout=timeout,
-                         json={'name': name, 'description': description})
+                         **encode_body(body, use_msgpack))
     if resp.status_code == 200:
         return "Item created successfully.", 0
     elif resp.status_code == 409:
@@ -46,19 +77,21 @@ def create_item(service_url, timeout, name, description):
         return get_error(resp)
 
 
-def query_item(service_url, timeout, name):
-    resp = requests.get(service_url, timeout=timeout, json={'name': name})
+def query_item(service_url, timeout, name, use_msgpack=False):
+    resp = requests.get(item_url(service_url, name), timeout=timeout,
+                        **encode_body(None, use_msgpack))
     if resp.status_code == 200:
-        return "Description: {description}".format(**resp.json()), 0
+        return "Description: {description}".format(**decode_body(resp)), 0
     elif resp.status_code == 404:
         return "Item not found.", 1
     else:
         return get_error(resp)
 
 
-def update_item(service_url, timeout, name, description):
-    resp = requests.put(service_url, timeout=timeout,
-                        json={'name': name, 'description': description})
+def update_item(service_url, timeout, name, description, use_msgpack=False):
+    resp = requests.put(item_url(service_url, name), timeout=timeout,
+                        **encode_body({'description': description},
+                                      use_msgpack))
     if resp.status_code == 200:
         return "Item updated successfully.", 0
     elif resp.status_code == 404:
@@ -67,8 +100,9 @@ def update_item(service_url, timeout, name, description):
         return get_error(resp)
 
 
-def delete_item(service_url, timeout, name):
-    resp = requests.delete(service_url, timeout=timeout, json={'name': name})
+def delete_item(service_url, timeout, name, use_msgpack=False):
+    resp = requests.delete(item_url(service_url, name), timeout=timeout,
+                           **encode_body(None, use_msgpack))
     if resp.status_code == 200:
         return "Item deleted successfully.", 0
     elif resp.status_code == 204:
@@ -77,10 +111,11 @@ def delete_item(service_url, timeout, name):
         return get_error(resp)
 
 
-def list_items(service_url, timeout):
-    resp = requests.get(service_url, timeout=timeout)
+def list_items(service_url, timeout, use_msgpack=False):
+    resp = requests.get(service_url, timeout=timeout,
+                        **encode_body(None, use_msgpack))
     if resp.status_code == 200:
-        items = resp.json()['items']
+        items = decode_body(resp)['items']
         if items:
             return (
                 "Items:\n" + "\n".join("- {name}".format(**item)
@@ -93,22 +128,38 @@ def list_items(service_url, timeout):
         return get_error(resp)
 
 
+def count_items(service_url, timeout):
+    resp = requests.head(service_url, timeout=timeout)
+    if resp.status_code == 200:
+        return "Number of items: {}".format(resp.headers['X-Total-Count']), 0
+    else:
+        return get_error(resp)
+
+
 if __name__ == '__main__':
     cmd_args = parser.parse_args()
 
     service_url = cmd_args.url
     timeout = cmd_args.timeout
+    use_msgpack = cmd_args.msgpack
 
     if cmd_args.create:
-        msg, code = create_item(service_url, timeout, *cmd_args.create)
+        msg, code = create_item(service_url, timeout, *cmd_args.create,
+                                use_msgpack=use_msgpack)
     elif cmd_args.query:
-        msg, code = query_item(service_url, timeout, cmd_args.query)
+        msg, code = query_item(service_url, timeout, cmd_args.query,
+                               use_msgpack=use_msgpack)
     elif cmd_args.update:
-        msg, code = update_item(service_url, timeout, *cmd_args.update)
+        msg, code = update_item(service_url, timeout, *cmd_args.update,
+                                use_msgpack=use_msgpack)
     elif cmd_args.delete:
-        msg, code = delete_item(service_url, timeout, cmd_args.delete)
+        msg, code = delete_item(service_url, timeout, cmd_args.delete,
+                                use_msgpack=use_msgpack)
     elif cmd_args.list:
-        msg, code = list_items(service_url, timeout)
+        msg, code = list_items(service_url, timeout,
+                               use_msgpack=use_msgpack)
+    elif cmd_args.count:
+        msg, code = count_items(service_url, timeout)
     else:
         msg, code = parser.format_help(), -1
 
@@ -1,46 +1,68 @@
+import msgpack
 import unittest
 from unittest.mock import patch
 
-from main import create_item, delete_item, list_items, query_item, update_item
+from main import (count_items, create_item, delete_item, list_items,
+                  query_item, update_item)
 
 
 class MockResponse:
-    def __init__(self, status_code, reason=None, json=None):
+    def __init__(self, status_code, reason=None, json=None, headers=None):
         self.status_code = status_code
         self.reason = reason
+        self.headers = headers or {}
         self._json = json
 
     def json(self):
         return self._json
 
+    @property
+    def content(self):
+        return msgpack.packb(self._json, use_bin_type=True)
+
 
 class MockRequests:
     def __init__(self, response):
         self.calls = []
         self.response = response
 
-    def delete(self, url, timeout, json=None):
-        self.calls.append(('delete', url, timeout, json))
+    def delete(self, url, timeout, json=None, data=None, headers=None):
+        self.calls.append(('delete', url, timeout, json, data, headers))
+        return self.response
+
+    def get(self, url, timeout, json=None, data=None, headers=None):
+        self.calls.append(('get', url, timeout, json, data, headers))
         return self.response
 
-    def get(self, url, timeout, json=None):
-        self.calls.append(('get', url, timeout, json))
+    def head(self, url, timeout):
+        self.calls.append(('head', url, timeout))
         return self.response
 
-    def post(self, url, timeout, json=None):
-        self.calls.append(('post', url, timeout, json))
+    def post(self, url, timeout, json=None, data=None, headers=None):
+        self.calls.append(('post', url, timeout, json, data, headers))
         return self.response
 
-    def put(self, url, timeout, json=None):
-        self.calls.append(('put', url, timeout, json))
+    def put(self, url, timeout, json=None, data=None, headers=None):
+        self.calls.append(('put', url, timeout, json, data, headers))
         return self.response
 
 
 class ClientTestCase(unittest.TestCase):
     def setUp(self):
-        self.service_url = object()
+        self.service_url = 'http://localhost/items'
         self.timeout = object()
 
+    def test_count_items(self):
+        mock_response = MockResponse(200, headers={'X-Total-Count': '42'})
+        mock_requests = MockRequests(mock_response)
+        with patch('main.requests', new=mock_requests):
+            msg, code = count_items(self.service_url, self.timeout)
+            self.assertIn('42', msg)
+            self.assertEqual(code, 0)
+            self.assertEqual(len(mock_requests.calls), 1)
+            self.assertEqual(mock_requests.calls[0],
+                             ('head', self.service_url, self.timeout))
+
     def test_create_item_success(self):
         name = object()
         desc = object()
@@ -72,7 +94,7 @@ class ClientTestCase(unittest.TestCase):
                                  dict(name=name, description=desc))
 
     def test_delete_item_success(self):
-        name = object()
+        name = 'test item/1'
         mock_response = MockResponse(200)
         mock_requests = MockRequests(mock_response)
         with patch('main.requests', new=mock_requests):
@@ -80,12 +102,13 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 0)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'delete')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
-            self.assertDictEqual(mock_requests.calls[0][3], dict(name=name))
+            self.assertEqual(mock_requests.calls[0][3], None)
 
     def test_delete_item_failure(self):
-        name = object()
+        name = 'test item/1'
         mock_response = MockResponse(204)
         mock_requests = MockRequests(mock_response)
         with patch('main.requests', new=mock_requests):
@@ -93,9 +116,10 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 1)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'delete')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
-            self.assertDictEqual(mock_requests.calls[0][3], dict(name=name))
+            self.assertEqual(mock_requests.calls[0][3], None)
 
     def test_list_items(self):
         mock_response = MockResponse(200, json={
@@ -118,7 +142,7 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(mock_requests.calls[0][3], None)
 
     def test_query_item_success(self):
-        name = object()
+        name = 'test item/1'
         mock_response = MockResponse(200, json=dict(name='testitem',
                                                     description='testdesc'))
         mock_requests = MockRequests(mock_response)
@@ -128,12 +152,13 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 0)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'get')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
-            self.assertDictEqual(mock_requests.calls[0][3], dict(name=name))
+            self.assertEqual(mock_requests.calls[0][3], None)
 
     def test_query_item_failure(self):
-        name = object()
+        name = 'test item/1'
         mock_response = MockResponse(404)
         mock_requests = MockRequests(mock_response)
         with patch('main.requests', new=mock_requests):
@@ -141,13 +166,61 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 1)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'get')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
-            self.assertDictEqual(mock_requests.calls[0][3], dict(name=name))
+            self.assertEqual(mock_requests.calls[0][3], None)
+
+    def test_create_item_msgpack(self):
+        mock_response = MockResponse(200)
+        mock_requests = MockRequests(mock_response)
+        with patch('main.requests', new=mock_requests):
+            msg, code = create_item(self.service_url, self.timeout,
+                                    'name', 'desc', use_msgpack=True)
+            self.assertEqual(code, 0)
+            self.assertEqual(len(mock_requests.calls), 1)
+            self.assertEqual(mock_requests.calls[0][0], 'post')
+            self.assertEqual(mock_requests.calls[0][3], None)
+            self.assertDictEqual(msgpack.unpackb(mock_requests.calls[0][4],
+                                                raw=False),
+                                 dict(name='name', description='desc'))
+            self.assertEqual(mock_requests.calls[0][5]['Content-Type'],
+                             'application/msgpack')
+
+    def test_list_items_msgpack(self):
+        mock_response = MockResponse(200, json={
+            'items': [dict(name='item1', description='desc1')]
+        }, headers={'Content-Type': 'application/msgpack'})
+        mock_requests = MockRequests(mock_response)
+        with patch('main.requests', new=mock_requests):
+            msg, code = list_items(self.service_url, self.timeout,
+                                   use_msgpack=True)
+            self.assertIn('item1', msg)
+            self.assertEqual(code, 0)
+            self.assertEqual(mock_requests.calls[0][4], None)
+            self.assertEqual(mock_requests.calls[0][5]['Accept'],
+                             'application/msgpack')
+
+    def test_query_item_msgpack(self):
+        mock_response = MockResponse(200, json=dict(name='testitem',
+                                                    description='testdesc'),
+                                     headers={'Content-Type':
+                                              'application/msgpack'})
+        mock_requests = MockRequests(mock_response)
+        with patch('main.requests', new=mock_requests):
+            msg, code = query_item(self.service_url, self.timeout, 'testitem',
+                                   use_msgpack=True)
+            self.assertIn('testdesc', msg)
+            self.assertEqual(code, 0)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/testitem')
+            self.assertEqual(mock_requests.calls[0][4], None)
+            self.assertEqual(mock_requests.calls[0][5]['Accept'],
+                             'application/msgpack')
 
     def test_update_item_success(self):
-        name = object()
-        desc = object()
+        name = 'test item/1'
+        desc = 'test desc'
         mock_response = MockResponse(200)
         mock_requests = MockRequests(mock_response)
         with patch('main.requests', new=mock_requests):
@@ -155,14 +228,15 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 0)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'put')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
             self.assertDictEqual(mock_requests.calls[0][3],
-                                 dict(name=name, description=desc))
+                                 dict(description=desc))
 
     def test_update_item_failure(self):
-        name = object()
-        desc = object()
+        name = 'test item/1'
+        desc = 'test desc'
         mock_response = MockResponse(404)
         mock_requests = MockRequests(mock_response)
         with patch('main.requests', new=mock_requests):
@@ -170,10 +244,11 @@ class ClientTestCase(unittest.TestCase):
             self.assertEqual(code, 1)
             self.assertEqual(len(mock_requests.calls), 1)
             self.assertEqual(mock_requests.calls[0][0], 'put')
-            self.assertEqual(mock_requests.calls[0][1], self.service_url)
+            self.assertEqual(mock_requests.calls[0][1],
+                             self.service_url + '/test%20item%2F1')
             self.assertEqual(mock_requests.calls[0][2], self.timeout)
             self.assertDictEqual(mock_requests.calls[0][3],
-                                 dict(name=name, description=desc))
+                                 dict(description=desc))
 
 
 if __name__ == '__main__':
@@ -136,6 +136,28 @@ class IntegrationTestCase(unittest.TestCase):
             for item in items:
                 self.assertIn(item['name'], out)
 
+    def test_msgpack(self):
+        name = 'test item'
+        desc = 'test desc'
+        with service_context():
+            code, out, err = call_client(self.service_url, '-m',
+                                         '-c', name, desc)
+            self.assertEqual(code, 0)
+            code, out, err = call_client(self.service_url, '-m', '-q', name)
+            self.assertEqual(code, 0)
+            self.assertIn(desc, out)
+            code, out, err = call_client(self.service_url, '-m', '-l')
+            self.assertEqual(code, 0)
+            self.assertIn(name, out)
+
+    def test_count(self):
+        for name in ('item1', 'item2', 'item3'):
+            redis_db.set(name.encode('utf-8'), 'desc'.encode('utf-8'))
+        with service_context():
+            code, out, err = call_client(self.service_url, '-n')
+            self.assertEqual(code, 0)
+            self.assertIn('3', out)
+
     def tearDown(self):
         redis_db.flushdb()  # clear db
 
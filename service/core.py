@@ -1,4 +1,11 @@
-from flask import jsonify, request, Response
+from flask import abort, jsonify, request, Response
+import msgpack
+from threading import Event, Lock
+import time
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
 
 
 def encode(s):
@@ -11,8 +18,23 @@ def decode(b):
 
 class RedisWrapper:
     def __init__(self, host, port, db):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.connect()
+
+    def connect(self):
+        """(Re)create the Redis client along with its connection pool.
+
+        Should be called in each worker process after forking, so that
+        workers never share sockets inherited from their parent.
+        """
         from redis import StrictRedis
-        self.rdb = StrictRedis(host=host, port=port, db=db)
+        self.rdb = StrictRedis(host=self.host, port=self.port, db=self.db)
+
+    def count(self):
+        # the database holds items only, so its size is the item count
+        return self.rdb.dbsize()
 
     def get_all(self):
         keys = self.rdb.keys()
@@ -32,59 +54,294 @@ class RedisWrapper:
     def try_upd(self, key, value):
         return self.rdb.set(encode(key), encode(value), xx=True)
 
+    def metrics(self):
+        return {}
+
+
+class PendingWrite:
+    def __init__(self, key, value, nx, xx):
+        self.key = key
+        self.value = value
+        self.nx = nx
+        self.xx = xx
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class BatchMetrics:
+    def __init__(self):
+        self.batches = 0
+        self.writes = 0
+        self.max_batch_size = 0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def record(self, batch_size, flush_latency):
+        self.batches += 1
+        self.writes += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.total_flush_latency += flush_latency
+        self.max_flush_latency = max(self.max_flush_latency, flush_latency)
+
+    def as_dict(self):
+        batches = self.batches or 1
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'batch_size': {
+                'mean': self.writes / batches,
+                'max': self.max_batch_size,
+            },
+            'flush_latency_ms': {
+                'mean': 1000 * self.total_flush_latency / batches,
+                'max': 1000 * self.max_flush_latency,
+            },
+        }
+
+
+class BatchingRedisWrapper(RedisWrapper):
+    """Redis wrapper coalescing concurrent inserts and updates.
+
+    The first write arriving at an idle wrapper waits for `window` seconds,
+    then flushes every write gathered in the meantime in a single pipeline.
+    Each writer still gets the result of its own SET.
+    Coalescing only happens if a worker serves requests concurrently
+    (e.g. gevent, eventlet or threaded workers).
+    Writers give up with `TimeoutError` if their batch is not flushed within
+    `wait_timeout` seconds.
+    """
+    def __init__(self, host, port, db, window, wait_timeout=10):
+        self.window = window
+        self.wait_timeout = wait_timeout
+        super().__init__(host, port, db)
+
+    def connect(self):
+        super().connect()
+        self.lock = Lock()
+        self.pending = []
+        self.batch_metrics = BatchMetrics()
+
+    def try_ins(self, key, value):
+        return self.write(PendingWrite(encode(key), encode(value),
+                                       nx=True, xx=False))
+
+    def try_upd(self, key, value):
+        return self.write(PendingWrite(encode(key), encode(value),
+                                       nx=False, xx=True))
+
+    def metrics(self):
+        return {'write_batching': self.batch_metrics.as_dict()}
+
+    def write(self, pending_write):
+        with self.lock:
+            self.pending.append(pending_write)
+            is_leader = len(self.pending) == 1
+
+        if is_leader:
+            batch = None
+            try:
+                time.sleep(self.window)
+                with self.lock:
+                    batch, self.pending = self.pending, []
+                self.flush(batch)
+            finally:
+                # e.g. the greenlet got killed: release the other writers
+                # and let the next write start a new batch
+                if batch is None:
+                    with self.lock:
+                        batch, self.pending = self.pending, []
+                self.abort(batch)
+        elif not pending_write.done.wait(self.wait_timeout):
+            with self.lock:
+                if pending_write in self.pending:
+                    self.pending.remove(pending_write)
+            raise TimeoutError("Write batch was not flushed in time.")
+
+        if pending_write.error is not None:
+            raise pending_write.error
+        return pending_write.result
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        try:
+            pipe = self.rdb.pipeline(transaction=False)
+            for w in batch:
+                pipe.set(w.key, w.value, nx=w.nx, xx=w.xx)
+            results = pipe.execute(raise_on_error=False)
+        except Exception as e:
+            results = [e] * len(batch)
+        latency = time.perf_counter() - start
+
+        for w, result in zip(batch, results):
+            if isinstance(result, Exception):
+                w.error = result
+            else:
+                w.result = result
+            w.done.set()
+
+        with self.lock:
+            self.batch_metrics.record(len(batch), latency)
+
+    def abort(self, batch):
+        """Fail every write of the batch that has not been flushed."""
+        for w in batch:
+            if not w.done.is_set():
+                w.error = RuntimeError("Write batch was aborted.")
+                w.done.set()
+
+
+# names of the endpoints sharing the namespace of the item paths
+RESERVED_NAMES = ('_count', '_metrics')
+
+
+def make_response(status_code, headers=None):
+    return Response(status=status_code, headers=headers)
+
+
+def get_body():
+    """Parse the request body according to its `Content-Type`.
+
+    :returns: the parsed body, or `None` if there is none
+    """
+    if request.mimetype == MSGPACK:
+        data = request.get_data()
+        if not data:
+            return None
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except ValueError:
+            abort(400)
+    return request.get_json(silent=True)
+
 
-def make_response(status_code):
-    return Response(status=status_code)
+def get_field(body, key):
+    """Get a string field of the request body, or respond with 400."""
+    value = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(value, str):
+        abort(400)
+    return value
 
 
-def configure_app(app, url_path, db):
+def make_body_response(body):
+    """Serialize the response body according to the `Accept` header.
+
+    JSON is used unless MessagePack is preferred by the client.
+    """
+    if request.accept_mimetypes.best_match([JSON, MSGPACK]) == MSGPACK:
+        return Response(msgpack.packb(body, use_bin_type=True),
+                        mimetype=MSGPACK)
+    return jsonify(body)
+
+
+def make_cacheable(response, max_age):
+    """Let HTTP caches store the response for `max_age` seconds.
+
+    Adds an ETag, so caches can revalidate stale entries with a conditional
+    request, which is answered with 304 if the item has not changed.
+    """
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.vary.add('Accept')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def configure_app(app, url_path, db, cache_max_age=5):
     """Configure the provided Flask application.
 
+    Items are available both via the collection (identified by the request
+    body) and via their own resource paths (`<url_path>/<name>`).
+    Only the latter can be cached by HTTP caches.
+
     :param app: Flask application to configure
     :param url_path: path string specifying the route
     :param db: database instance to use
+    :param cache_max_age: seconds HTTP caches may serve items without
+                          revalidation
     :returns: the specified Flask application
     """
+    item_path = url_path + '/<path:name>'
+
+    def respond_query(name):
+        desc = db.try_get(name)
+        if desc is None:
+            return make_response(404)
+        else:
+            return make_body_response({'name': name, 'description': desc})
+
+    def respond_update(name, desc):
+        if db.try_upd(name, desc):
+            return make_response(200)
+        else:
+            return make_response(404)
+
+    def respond_delete(name):
+        if db.try_del(name):
+            return make_response(200)
+        else:
+            return make_response(204)
+
     @app.route(url_path, methods=['POST'])
     def create_item():
-        name = request.json['name']
-        desc = request.json['description']
+        body = get_body()
+        name = get_field(body, 'name')
+        desc = get_field(body, 'description')
 
+        if name in RESERVED_NAMES:
+            return make_response(400)
         if db.try_ins(name, desc):
             return make_response(200)
         else:
             return make_response(409)
 
+    # has to precede the GET route, which would also match HEAD requests
+    @app.route(url_path, methods=['HEAD'])
+    def count_items_head():
+        return make_response(200, {'X-Total-Count': str(db.count())})
+
+    @app.route(url_path + '/_count', methods=['GET'])
+    def count_items():
+        return make_body_response({'count': db.count()})
+
+    @app.route(url_path + '/_metrics', methods=['GET'])
+    def metrics():
+        return make_body_response(db.metrics())
+
     @app.route(url_path, methods=['GET'])
     def query_item_or_list_items():
-        if request.json and 'name' in request.json:  # query item
-            name = request.json['name']
-            desc = db.try_get(name)
-            if desc is None:
-                return make_response(404)
-            else:
-                return jsonify({'name': name, 'description': desc})
+        body = get_body()
+        if isinstance(body, dict) and 'name' in body:  # query item
+            return respond_query(get_field(body, 'name'))
         else:  # list items
-            return jsonify({'items': [{'name': name, 'description': desc}
-                                      for name, desc in db.get_all()]})
+            return make_body_response({
+                'items': [{'name': name, 'description': desc}
+                          for name, desc in db.get_all()]
+            })
 
     @app.route(url_path, methods=['PUT'])
     def update_item():
-        name = request.json['name']
-        desc = request.json['description']
-
-        if db.try_upd(name, desc):
-            return make_response(200)
-        else:
-            return make_response(404)
+        body = get_body()
+        return respond_update(get_field(body, 'name'),
+                              get_field(body, 'description'))
 
     @app.route(url_path, methods=['DELETE'])
     def delete_item():
-        name = request.json['name']
+        return respond_delete(get_field(get_body(), 'name'))
 
-        if db.try_del(name):
-            return make_response(200)
-        else:
-            return make_response(204)
+    @app.route(item_path, methods=['GET'])
+    def query_item_by_path(name):
+        response = respond_query(name)
+        if response.status_code == 200:
+            response = make_cacheable(response, cache_max_age)
+        return response
+
+    @app.route(item_path, methods=['PUT'])
+    def update_item_by_path(name):
+        return respond_update(name, get_field(get_body(), 'description'))
+
+    @app.route(item_path, methods=['DELETE'])
+    def delete_item_by_path(name):
+        return respond_delete(name)
 
     return app
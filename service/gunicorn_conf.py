@@ -0,0 +1,80 @@
+""" Gunicorn configuration for production deployment.
+
+Every setting can be customized via environment variables, e.g.:
+    GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn_conf.py wsgi:application
+"""
+import multiprocessing
+import os
+import sys
+
+
+ASYNC_WORKER_CLASSES = ('gevent', 'eventlet')
+
+
+def default_workers(worker_class, cpu_count):
+    """Derive the number of worker processes from the number of CPUs.
+
+    :param worker_class: name of the Gunicorn worker class
+    :param cpu_count: number of available CPUs
+    :returns: the number of workers to spawn
+    """
+    if worker_class in ASYNC_WORKER_CLASSES:
+        # cooperative workers serve many connections each, one per core is
+        # enough to keep the CPUs busy
+        return cpu_count
+    return 2 * cpu_count + 1
+
+
+def patch_for_cooperative_io(worker_class):
+    """Monkey patch the standard library for the given worker class.
+
+    Patching has to happen before the application (and thus the Redis
+    client) gets imported, otherwise preloaded modules keep references to
+    the blocking socket implementation.
+
+    :param worker_class: name of the Gunicorn worker class
+    """
+    if worker_class == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif worker_class == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+
+
+bind = os.environ.get('GUNICORN_BIND', 'localhost:8000')
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('GUNICORN_WORKERS') or
+              default_workers(worker_class, multiprocessing.cpu_count()))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# load the application once in the master, workers share its memory pages
+preload_app = True
+
+# keep client connections open between requests (ignored by sync workers)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# recycle workers one by one instead of all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER',
+                                         max_requests // 10))
+
+if worker_class in ASYNC_WORKER_CLASSES:
+    patch_for_cooperative_io(worker_class)
+
+# sync workers serve one request at a time, so writes would never coalesce,
+# each one would just wait for the whole window
+if os.environ.get('WRITE_BATCH_WINDOW') and worker_class == 'sync':
+    raise RuntimeError("WRITE_BATCH_WINDOW requires gevent or eventlet "
+                       "workers.")
+
+
+def post_fork(server, worker):
+    """Give each worker its own Redis connection pool."""
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is not None:  # the application has been preloaded
+        wsgi.db.connect()
@@ -3,7 +3,7 @@ from argparse import ArgumentParser
 from flask import Flask
 import os
 
-from core import configure_app, RedisWrapper
+from core import BatchingRedisWrapper, configure_app, RedisWrapper
 
 
 parser = ArgumentParser("The Items Service standalone server.")
@@ -13,6 +13,12 @@ parser.add_argument('--host', default='localhost',
 parser.add_argument('--port', type=int, required=True)
 parser.add_argument('--path', required=True,
                     help="URL path of the service. E.g.: /items")
+parser.add_argument('--batch-window', type=float,
+                    help="Coalesce writes arriving within this many "
+                         "milliseconds. Batching is disabled by default.")
+parser.add_argument('--cache-max-age', type=int, default=5,
+                    help="Seconds HTTP caches may serve items without "
+                         "revalidation. Default is 5.")
 parser.add_argument('--debug', action='store_true',
                     help="Start the service in debug mode.")
 
@@ -24,6 +30,11 @@ if __name__ == '__main__':
     redis_port = int(os.environ['REDIS_PORT'])
     redis_db = int(os.environ['REDIS_DB'])
 
-    db = RedisWrapper(redis_host, redis_port, redis_db)
-    app = configure_app(Flask(__name__), args.path, db)
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    if args.batch_window:
+        db = BatchingRedisWrapper(redis_host, redis_port, redis_db,
+                                  args.batch_window / 1000)
+    else:
+        db = RedisWrapper(redis_host, redis_port, redis_db)
+    app = configure_app(Flask(__name__), args.path, db, args.cache_max_age)
+    app.run(host=args.host, port=args.port, debug=args.debug,
+            threaded=bool(args.batch_window))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+parser = ArgumentParser("The Items Service production server.")
+parser.add_argument('--host', default='localhost',
+                    help="IP or hostname of the service. "
+                         "Default is localhost.")
+parser.add_argument('--port', type=int, required=True)
+parser.add_argument('--path', required=True,
+                    help="URL path of the service. E.g.: /items")
+parser.add_argument('--workers', type=int,
+                    help="Number of worker processes. "
+                         "Default is derived from the number of CPUs.")
+parser.add_argument('--worker-class', choices=('sync', 'gevent', 'eventlet'),
+                    help="Type of worker processes. Default is sync.")
+parser.add_argument('--cache-max-age', type=int,
+                    help="Seconds HTTP caches may serve items without "
+                         "revalidation. Default is 5.")
+parser.add_argument('--batch-window', type=float,
+                    help="Coalesce writes arriving within this many "
+                         "milliseconds. Batching is disabled by default.")
+
+
+class Server(BaseApplication):
+    """Gunicorn application serving the `wsgi` module.
+
+    Settings are read from `gunicorn_conf.py`, then overridden by `options`.
+    """
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        import gunicorn_conf
+        config = {key: value for key, value in vars(gunicorn_conf).items()
+                  if key in self.cfg.settings}
+        config.update(self.options)
+        for key, value in config.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from wsgi import application
+        return application
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    worker_class = (args.worker_class or
+                    os.environ.get('GUNICORN_WORKER_CLASS', 'sync'))
+    if args.batch_window and worker_class == 'sync':
+        parser.error("--batch-window requires gevent or eventlet workers, "
+                     "sync workers serve one request at a time.")
+
+    os.environ['URL_PATH'] = args.path
+    # the config module derives worker count and patching from these
+    if args.worker_class:
+        os.environ['GUNICORN_WORKER_CLASS'] = args.worker_class
+    if args.workers:
+        os.environ['GUNICORN_WORKERS'] = str(args.workers)
+    if args.cache_max_age is not None:
+        os.environ['CACHE_MAX_AGE'] = str(args.cache_max_age)
+    if args.batch_window:
+        os.environ['WRITE_BATCH_WINDOW'] = str(args.batch_window)
+
+    Server({'bind': '{}:{}'.format(args.host, args.port)}).run()
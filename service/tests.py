@@ -1,7 +1,17 @@
+import json
+from threading import Thread
+import time
 import unittest
 from unittest.mock import patch
 
-from core import configure_app
+from flask import Flask
+import msgpack
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import BadRequest
+from werkzeug.wrappers import Response
+
+from core import BatchingRedisWrapper, configure_app
+from gunicorn_conf import default_workers
 
 
 class MockApp:
@@ -24,10 +34,18 @@ class MockDB:
         self.calls = []
         self.result = None
 
+    def count(self):
+        self.calls.append(('count', ))
+        return self.result
+
     def get_all(self):
         self.calls.append(('get_all', ))
         return self.result
 
+    def metrics(self):
+        self.calls.append(('metrics', ))
+        return self.result
+
     def try_del(self, key):
         self.calls.append(('try_del', key))
         return self.result
@@ -46,13 +64,24 @@ class MockDB:
 
 
 class MockRequest:
-    def __init__(self, json):
+    def __init__(self, json=None, mimetype='application/json', data=b'',
+                 accept=()):
         self.json = json
+        self.mimetype = mimetype
+        self.data = data
+        self.accept_mimetypes = MIMEAccept(accept)
+        self.environ = {'REQUEST_METHOD': 'GET'}
+
+    def get_data(self):
+        return self.data
+
+    def get_json(self, silent=False):
+        return self.json
 
 
 class ServiceTestCase(unittest.TestCase):
     def setUp(self):
-        self.url_path = object()
+        self.url_path = '/items'
         self.db = MockDB()
         self.app = configure_app(MockApp(), self.url_path, self.db)
 
@@ -62,6 +91,20 @@ class ServiceTestCase(unittest.TestCase):
     def test_route_query_and_list(self):
         self.assertTrue((self.url_path, 'GET') in self.app.routes)
 
+    def test_route_count(self):
+        self.assertTrue((self.url_path, 'HEAD') in self.app.routes)
+        self.assertTrue((self.url_path + '/_count', 'GET')
+                        in self.app.routes)
+
+    def test_route_metrics(self):
+        self.assertTrue((self.url_path + '/_metrics', 'GET')
+                        in self.app.routes)
+
+    def test_route_item(self):
+        for method in ('GET', 'PUT', 'DELETE'):
+            self.assertTrue((self.url_path + '/<path:name>', method)
+                            in self.app.routes)
+
     def test_route_update(self):
         self.assertTrue((self.url_path, 'PUT') in self.app.routes)
 
@@ -71,8 +114,8 @@ class ServiceTestCase(unittest.TestCase):
     def test_create_success(self):
         create_func = self.app.routes[(self.url_path, 'POST')]
         self.db.result = True
-        name = object()
-        desc = object()
+        name = 'test item'
+        desc = 'test desc'
         mock_request = MockRequest(dict(name=name, description=desc))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -83,8 +126,8 @@ class ServiceTestCase(unittest.TestCase):
     def test_create_failure(self):
         create_func = self.app.routes[(self.url_path, 'POST')]
         self.db.result = None
-        name = object()
-        desc = object()
+        name = 'test item'
+        desc = 'test desc'
         mock_request = MockRequest(dict(name=name, description=desc))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -92,10 +135,20 @@ class ServiceTestCase(unittest.TestCase):
                 self.assertEqual(len(self.db.calls), 1)
                 self.assertEqual(self.db.calls[0], ('try_ins', name, desc))
 
+    def test_create_reserved_name(self):
+        create_func = self.app.routes[(self.url_path, 'POST')]
+        self.db.result = True
+        for name in ('_count', '_metrics'):
+            mock_request = MockRequest(dict(name=name, description='desc'))
+            with patch('core.request', new=mock_request):
+                with patch('core.make_response', new=lambda c: c):
+                    self.assertEqual(create_func(), 400)
+        self.assertEqual(self.db.calls, [])
+
     def test_query_success(self):
         query_and_list_func = self.app.routes[(self.url_path, 'GET')]
         self.db.result = object()
-        name = object()
+        name = 'test item'
         mock_request = MockRequest(dict(name=name))
         with patch('core.request', new=mock_request):
             with patch('core.jsonify', new=lambda c: c):
@@ -109,7 +162,7 @@ class ServiceTestCase(unittest.TestCase):
     def test_query_failure(self):
         query_and_list_func = self.app.routes[(self.url_path, 'GET')]
         self.db.result = None
-        name = object()
+        name = 'test item'
         mock_request = MockRequest(dict(name=name))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -120,8 +173,8 @@ class ServiceTestCase(unittest.TestCase):
     def test_update_success(self):
         update_func = self.app.routes[(self.url_path, 'PUT')]
         self.db.result = True
-        name = object()
-        desc = object()
+        name = 'test item'
+        desc = 'test desc'
         mock_request = MockRequest(dict(name=name, description=desc))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -132,8 +185,8 @@ class ServiceTestCase(unittest.TestCase):
     def test_update_failure(self):
         update_func = self.app.routes[(self.url_path, 'PUT')]
         self.db.result = None
-        name = object()
-        desc = object()
+        name = 'test item'
+        desc = 'test desc'
         mock_request = MockRequest(dict(name=name, description=desc))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -144,7 +197,7 @@ class ServiceTestCase(unittest.TestCase):
     def test_delete_success(self):
         delete_func = self.app.routes[(self.url_path, 'DELETE')]
         self.db.result = True
-        name = object()
+        name = 'test item'
         mock_request = MockRequest(dict(name=name))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -155,7 +208,7 @@ class ServiceTestCase(unittest.TestCase):
     def test_delete_failure(self):
         delete_func = self.app.routes[(self.url_path, 'DELETE')]
         self.db.result = False
-        name = object()
+        name = 'test item'
         mock_request = MockRequest(dict(name=name))
         with patch('core.request', new=mock_request):
             with patch('core.make_response', new=lambda c: c):
@@ -176,6 +229,327 @@ class ServiceTestCase(unittest.TestCase):
                 self.assertEqual(len(self.db.calls), 1)
                 self.assertEqual(self.db.calls[0], ('get_all', ))
 
+    def test_count(self):
+        count_func = self.app.routes[(self.url_path + '/_count', 'GET')]
+        self.db.result = 3
+        with patch('core.request', new=MockRequest()):
+            with patch('core.jsonify', new=lambda c: c):
+                self.assertDictEqual(count_func(), {'count': 3})
+                self.assertEqual(self.db.calls, [('count', )])
+
+    def test_count_head(self):
+        head_func = self.app.routes[(self.url_path, 'HEAD')]
+        self.db.result = 3
+        with patch('core.make_response', new=lambda c, h=None: (c, h)):
+            self.assertEqual(head_func(), (200, {'X-Total-Count': '3'}))
+            self.assertEqual(self.db.calls, [('count', )])
+
+    def test_metrics(self):
+        metrics_func = self.app.routes[(self.url_path + '/_metrics',
+                                        'GET')]
+        self.db.result = {'write_batching': object()}
+        with patch('core.request', new=MockRequest()):
+            with patch('core.jsonify', new=lambda c: c):
+                self.assertDictEqual(metrics_func(), self.db.result)
+                self.assertEqual(self.db.calls, [('metrics', )])
+
+    def test_create_msgpack(self):
+        create_func = self.app.routes[(self.url_path, 'POST')]
+        self.db.result = True
+        data = msgpack.packb({'name': 'a', 'description': 'b'})
+        mock_request = MockRequest(mimetype='application/msgpack', data=data)
+        with patch('core.request', new=mock_request):
+            with patch('core.make_response', new=lambda c: c):
+                self.assertEqual(create_func(), 200)
+                self.assertEqual(self.db.calls, [('try_ins', 'a', 'b')])
+
+    def test_query_msgpack(self):
+        query_and_list_func = self.app.routes[(self.url_path, 'GET')]
+        self.db.result = 'b'
+        data = msgpack.packb({'name': 'a'})
+        mock_request = MockRequest(mimetype='application/msgpack', data=data,
+                                   accept=[('application/msgpack', 1)])
+        with patch('core.request', new=mock_request):
+            response = query_and_list_func()
+            self.assertEqual(response.mimetype, 'application/msgpack')
+            body = msgpack.unpackb(response.get_data(), raw=False)
+            self.assertDictEqual(body, {'name': 'a', 'description': 'b'})
+            self.assertEqual(self.db.calls, [('try_get', 'a')])
+
+    def test_list_msgpack(self):
+        query_and_list_func = self.app.routes[(self.url_path, 'GET')]
+        self.db.result = [('a', 'b'), ('c', 'd')]
+        mock_request = MockRequest(accept=[('application/json', 0.5),
+                                           ('application/msgpack', 1)])
+        with patch('core.request', new=mock_request):
+            response = query_and_list_func()
+            self.assertEqual(response.mimetype, 'application/msgpack')
+            body = msgpack.unpackb(response.get_data(), raw=False)
+            self.assertDictEqual(body, {
+                'items': [{'name': 'a', 'description': 'b'},
+                          {'name': 'c', 'description': 'd'}]
+            })
+
+    def test_list_json_by_default(self):
+        query_and_list_func = self.app.routes[(self.url_path, 'GET')]
+        self.db.result = []
+        mock_request = MockRequest(accept=[('*/*', 1)])
+        with patch('core.request', new=mock_request):
+            with patch('core.jsonify', new=lambda c: c):
+                self.assertDictEqual(query_and_list_func(), {'items': []})
+
+    def test_query_by_path_success(self):
+        query_func = self.app.routes[(self.url_path + '/<path:name>', 'GET')]
+        self.db.result = 'b'
+        mock_request = MockRequest(accept=[('application/msgpack', 1)])
+        with patch('core.request', new=mock_request):
+            response = query_func(name='a')
+            self.assertEqual(response.status_code, 200)
+            body = msgpack.unpackb(response.get_data(), raw=False)
+            self.assertDictEqual(body, {'name': 'a', 'description': 'b'})
+            self.assertTrue(response.cache_control.public)
+            self.assertEqual(response.cache_control.max_age, 5)
+            self.assertIsNotNone(response.get_etag()[0])
+            self.assertEqual(self.db.calls, [('try_get', 'a')])
+
+    def test_query_by_path_not_modified(self):
+        query_func = self.app.routes[(self.url_path + '/<path:name>', 'GET')]
+        self.db.result = 'b'
+        mock_request = MockRequest(accept=[('application/msgpack', 1)])
+        with patch('core.request', new=mock_request):
+            etag = query_func(name='a').get_etag()[0]
+            mock_request.environ['HTTP_IF_NONE_MATCH'] = '"%s"' % etag
+            self.assertEqual(query_func(name='a').status_code, 304)
+
+    def test_query_by_path_failure(self):
+        query_func = self.app.routes[(self.url_path + '/<path:name>', 'GET')]
+        self.db.result = None
+        with patch('core.make_response',
+                   new=lambda c: Response(status=c)):
+            response = query_func(name='a')
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('Cache-Control', response.headers)
+            self.assertEqual(self.db.calls, [('try_get', 'a')])
+
+    def test_update_by_path(self):
+        update_func = self.app.routes[(self.url_path + '/<path:name>', 'PUT')]
+        self.db.result = True
+        desc = 'test desc'
+        mock_request = MockRequest(dict(description=desc))
+        with patch('core.request', new=mock_request):
+            with patch('core.make_response', new=lambda c: c):
+                self.assertEqual(update_func(name='a'), 200)
+                self.assertEqual(self.db.calls, [('try_upd', 'a', desc)])
+
+    def test_delete_by_path(self):
+        delete_func = self.app.routes[(self.url_path + '/<path:name>',
+                                       'DELETE')]
+        self.db.result = False
+        with patch('core.make_response', new=lambda c: c):
+            self.assertEqual(delete_func(name='a'), 204)
+            self.assertEqual(self.db.calls, [('try_del', 'a')])
+
+    def test_create_invalid(self):
+        create_func = self.app.routes[(self.url_path, 'POST')]
+        self.db.result = True
+        for body in (None, ['name', 'description'], dict(name='a'),
+                     dict(name=b'a', description='b'),
+                     dict(name='a', description=1)):
+            mock_request = MockRequest(body)
+            with patch('core.request', new=mock_request):
+                with self.assertRaises(BadRequest):
+                    create_func()
+        self.assertEqual(self.db.calls, [])
+
+
+class RoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = MockDB()
+        app = configure_app(Flask(__name__), '/items', self.db)
+        self.client = app.test_client()
+
+    def test_query_items_named_like_endpoints(self):
+        self.db.result = 'desc'
+        for name in ('count', 'metrics'):
+            response = self.client.get('/items/' + name)
+            self.assertEqual(response.status_code, 200)
+            self.assertDictEqual(json.loads(response.get_data(as_text=True)),
+                                 {'name': name, 'description': 'desc'})
+        self.assertEqual(self.db.calls, [('try_get', 'count'),
+                                         ('try_get', 'metrics')])
+
+    def test_list_without_body(self):
+        self.db.result = [('a', 'b')]
+        response = self.client.get('/items')
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(json.loads(response.get_data(as_text=True)),
+                             {'items': [{'name': 'a', 'description': 'b'}]})
+        response = self.client.get('/items',
+                                   headers={'Accept': 'application/msgpack'})
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(msgpack.unpackb(response.get_data(), raw=False),
+                             {'items': [{'name': 'a', 'description': 'b'}]})
+
+    def test_create_invalid_msgpack(self):
+        for body in (['a', 'b'], {b'name': b'a', 'description': 'b'},
+                     {'name': b'a', 'description': 'b'}):
+            data = msgpack.packb(body, use_bin_type=True)
+            response = self.client.post('/items', data=data,
+                                        content_type='application/msgpack')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.db.calls, [])
+
+    def test_endpoints(self):
+        self.db.result = 3
+        response = self.client.get('/items/_count')
+        self.assertDictEqual(json.loads(response.get_data(as_text=True)),
+                             {'count': 3})
+        self.db.result = {'write_batching': {'batches': 1}}
+        response = self.client.get('/items/_metrics')
+        self.assertDictEqual(json.loads(response.get_data(as_text=True)),
+                             self.db.result)
+        self.assertEqual(self.db.calls, [('count', ), ('metrics', )])
+
+
+class MockPipeline:
+    def __init__(self, store, error=None):
+        self.store = store
+        self.error = error
+        self.commands = []
+
+    def set(self, key, value, nx, xx):
+        self.commands.append((key, value, nx, xx))
+
+    def execute(self, raise_on_error=True):
+        if self.error is not None:
+            raise self.error
+        results = []
+        for key, value, nx, xx in self.commands:
+            exists = key in self.store
+            if (nx and exists) or (xx and not exists):
+                results.append(None)
+            else:
+                self.store[key] = value
+                results.append(True)
+        return results
+
+
+class MockRedis:
+    def __init__(self):
+        self.store = dict()
+        self.error = None
+        self.pipelines = []
+
+    def pipeline(self, transaction=True):
+        pipe = MockPipeline(self.store, self.error)
+        self.pipelines.append(pipe)
+        return pipe
+
+
+class BatchingRedisWrapperTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = BatchingRedisWrapper('localhost', 6379, 0, window=0.05)
+        self.db.rdb = MockRedis()
+
+    def run_concurrently(self, writes):
+        results = [None] * len(writes)
+
+        def run(i, write):
+            try:
+                results[i] = write()
+            except BaseException as e:
+                results[i] = e
+
+        threads = [Thread(target=run, args=(i, w))
+                   for i, w in enumerate(writes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_write(self):
+        self.assertTrue(self.db.try_ins('a', 'desc'))
+        self.assertEqual(len(self.db.rdb.pipelines), 1)
+        self.assertEqual(self.db.rdb.store, {b'a': b'desc'})
+
+    def test_coalesced_writes(self):
+        self.db.rdb.store[b'b'] = b'old'
+        results = self.run_concurrently([
+            lambda: self.db.try_ins('a', 'new'),
+            lambda: self.db.try_ins('b', 'new'),
+            lambda: self.db.try_upd('b', 'upd'),
+            lambda: self.db.try_upd('c', 'upd'),
+        ])
+        self.assertEqual(results, [True, None, True, None])
+        self.assertEqual(len(self.db.rdb.pipelines), 1)
+        self.assertEqual(self.db.rdb.store, {b'a': b'new', b'b': b'upd'})
+
+    def test_error(self):
+        self.db.rdb.error = ConnectionError()
+        results = self.run_concurrently([
+            lambda: self.db.try_ins('a', 'new'),
+            lambda: self.db.try_upd('b', 'upd'),
+        ])
+        self.assertIs(results[0], self.db.rdb.error)
+        self.assertIs(results[1], self.db.rdb.error)
+
+    def test_leader_killed(self):
+        class Killed(BaseException):
+            pass
+
+        real_sleep = time.sleep
+
+        def killed_sleep(seconds):
+            # wait for the follower to join the batch, then die
+            while len(self.db.pending) < 2:
+                real_sleep(0.001)
+            raise Killed()
+
+        with patch('core.time.sleep', new=killed_sleep):
+            leader = Thread(target=lambda: self.run_concurrently(
+                [lambda: self.db.try_ins('a', 'desc')]))
+            leader.start()
+            while not self.db.pending:
+                real_sleep(0.001)
+            result = self.run_concurrently(
+                [lambda: self.db.try_ins('b', 'desc')])[0]
+            leader.join()
+
+        self.assertIsInstance(result, RuntimeError)
+        self.assertEqual(self.db.pending, [])
+        self.assertTrue(self.db.try_ins('c', 'desc'))
+        self.assertEqual(self.db.rdb.store, {b'c': b'desc'})
+
+    def test_follower_timeout(self):
+        self.db.wait_timeout = 0.01
+        self.db.pending.append(object())  # a leader which never flushes
+        with self.assertRaises(TimeoutError):
+            self.db.try_ins('a', 'desc')
+        self.assertEqual(len(self.db.pending), 1)
+
+    def test_metrics(self):
+        self.run_concurrently([lambda: self.db.try_ins(str(i), 'desc')
+                               for i in range(3)])
+        self.db.try_ins('other', 'desc')
+        metrics = self.db.metrics()['write_batching']
+        self.assertEqual(metrics['batches'], 2)
+        self.assertEqual(metrics['writes'], 4)
+        self.assertEqual(metrics['batch_size']['max'], 3)
+        self.assertEqual(metrics['batch_size']['mean'], 2)
+        self.assertGreaterEqual(metrics['flush_latency_ms']['max'], 0)
+
+
+class GunicornConfTestCase(unittest.TestCase):
+    def test_workers_sync(self):
+        self.assertEqual(default_workers('sync', 4), 9)
+
+    def test_workers_gevent(self):
+        self.assertEqual(default_workers('gevent', 4), 4)
+
+    def test_workers_eventlet(self):
+        self.assertEqual(default_workers('eventlet', 4), 4)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,7 @@
 from flask import Flask
 import os
 
-from core import configure_app, RedisWrapper
+from core import BatchingRedisWrapper, configure_app, RedisWrapper
 
 
 url_path = os.environ['URL_PATH']
@@ -11,6 +11,16 @@ redis_host = os.environ['REDIS_HOST']
 redis_port = int(os.environ['REDIS_PORT'])
 redis_db = int(os.environ['REDIS_DB'])
 
-db = RedisWrapper(redis_host, redis_port, redis_db)
+# write batching window in milliseconds, batching is disabled if unset
+batch_window = os.environ.get('WRITE_BATCH_WINDOW')
 
-application = configure_app(Flask(__name__), url_path, db)
+if batch_window:
+    db = BatchingRedisWrapper(redis_host, redis_port, redis_db,
+                              float(batch_window) / 1000)
+else:
+    db = RedisWrapper(redis_host, redis_port, redis_db)
+
+# seconds HTTP caches may serve items without revalidation
+cache_max_age = int(os.environ.get('CACHE_MAX_AGE', 5))
+
+application = configure_app(Flask(__name__), url_path, db, cache_max_age)